@@ -1,16 +1,20 @@
 import os
 import sys
-import json
 import hashlib
 import zipfile
 import subprocess
-import io
-import shutil  # <-- ¡AQUÍ ESTÁ LA LIBRERÍA QUE FALTA!
+import shutil
+import tempfile
+import threading
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
 
+import orjson
 import requests
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+from pyarrow import csv as pacsv
+from numba import njit, prange
 from rich.console import Console
 from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeElapsedColumn
 
@@ -19,10 +23,10 @@ from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TimeEl
 
 # --- CONFIGURACIÓN ---
 URL_ZIPPED_DB = "https://www.miteco.gob.es/content/dam/miteco/es/agua/temas/evaluacion-de-los-recursos-hidricos/boletin-hidrologico/Historico-de-embalses/BD-Embalses.zip"
-ZIP_FILE = "temp_embalses.zip"
 MDB_FILE = "BD-Embalses.mdb"
-HASH_FILE = "last_mdb_hash.txt"
+HASH_FILE = "last_mdb_hash.txt"  # guarda el SHA-256 del último ZIP descargado
 JSON_OUTPUT = "datos_embalses_optimizado.json"
+CACHE_FILE = "stats_cache.parquet"  # resultados por embalse de la ejecución anterior
 TABLE_NAME = "T_Datos Embalses 1988-2026"
 
 console = Console()
@@ -48,104 +52,255 @@ METADATA = {
     }
 }
 
-def get_file_hash(filepath):
-    """Calcula el hash SHA-256 de un archivo."""
-    hasher = hashlib.sha256()
-    with open(filepath, 'rb') as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hasher.update(chunk)
-    return hasher.hexdigest()
-
 def descargar_y_extraer():
-    """Descarga el ZIP, extrae dinámicamente el MDB y limpia temporales."""
+    """Descarga el ZIP en streaming, lo hashea al vuelo y extrae el MDB.
+
+    Devuelve el SHA-256 del ZIP descargado, o None si coincide con el de la
+    última ejecución (en ese caso ni siquiera se descomprime).
+    """
     try:
         console.print(f"[cyan]Descargando datos desde:[/cyan] {URL_ZIPPED_DB}")
         response = requests.get(URL_ZIPPED_DB, stream=True, timeout=30)
         response.raise_for_status()
-        
-        with open(ZIP_FILE, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
-        
-        with zipfile.ZipFile(ZIP_FILE, 'r') as zip_ref:
-            # Buscamos el primer archivo que termine en .mdb (ignorando mayúsculas/minúsculas)
-            mdb_interno = next((nombre for nombre in zip_ref.namelist() if nombre.lower().endswith('.mdb')), None)
-            
-            if not mdb_interno:
-                raise FileNotFoundError("No se encontró ningún archivo .mdb dentro del ZIP de MITECO.")
-            
-            # Lo leemos directamente del ZIP y lo escribimos con nuestro nombre estándar
-            # Esto evita problemas si el archivo original venía metido en subcarpetas
-            with zip_ref.open(mdb_interno) as source, open(MDB_FILE, "wb") as target:
-                shutil.copyfileobj(source, target)
-            
-        # Limpieza inmediata para ahorrar espacio
-        os.remove(ZIP_FILE)
-        console.print(f"[green]✔ Descarga completada. MDB extraído dinámicamente ({mdb_interno}). ZIP eliminado.[/green]")
-        
+
+        # El ZIP se acumula en memoria y sólo toca disco si supera los 64 MB:
+        # evitamos escribir, releer y borrar un archivo temporal. El hash se
+        # calcula sobre la marcha, solapado con la propia descarga.
+        hasher = hashlib.sha256()
+        with tempfile.SpooledTemporaryFile(max_size=64 << 20) as spooled:
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                hasher.update(chunk)
+                spooled.write(chunk)
+            current_hash = hasher.hexdigest()
+
+            # Si el ZIP es idéntico al de la última ejecución no hay nada que
+            # hacer: salimos antes de descomprimir ni escribir el MDB
+            if os.path.exists(HASH_FILE):
+                with open(HASH_FILE, 'r') as f:
+                    if f.read().strip() == current_hash:
+                        return None
+
+            with zipfile.ZipFile(spooled, 'r') as zip_ref:
+                # Buscamos el primer archivo que termine en .mdb (ignorando mayúsculas/minúsculas)
+                mdb_interno = next((info.filename for info in zip_ref.infolist()
+                                    if info.filename.lower().endswith('.mdb')), None)
+
+                if not mdb_interno:
+                    raise FileNotFoundError("No se encontró ningún archivo .mdb dentro del ZIP de MITECO.")
+
+                # Lo leemos directamente del ZIP y lo escribimos con nuestro nombre estándar
+                # Esto evita problemas si el archivo original venía metido en subcarpetas
+                with zip_ref.open(mdb_interno) as source, open(MDB_FILE, "wb") as target:
+                    shutil.copyfileobj(source, target, length=1 << 20)
+
+        console.print(f"[green]✔ Descarga completada. MDB extraído dinámicamente ({mdb_interno}) sin ZIP temporal en disco.[/green]")
+        return current_hash
+
     except Exception as e:
         console.print(f"[bold red]✖ Error en la descarga/extracción: {e}[/bold red]")
         sys.exit(1)
 
-def calcular_estadisticas_embalse(df_embalse):
-    """Calcula indicadores estadísticos para un embalse individual."""
-    if df_embalse.empty:
-        return pd.Series()
+# Columnas de la matriz de salida del kernel
+_COLS_STATS = ['aa', 'at', 'm1s', 'm2s', 'm1m', 'ma1',
+               'h3a', 'h5a', 'h10a', 'h20a', 'ht']
 
-    # Aseguramos que está ordenado del más reciente al más antiguo
-    df_embalse = df_embalse.sort_values('FECHA', ascending=False)
-    fecha_referencia = df_embalse['FECHA'].iloc[0] 
-    mes_ref = fecha_referencia.month
-    
-    # Datos actuales
-    aa = df_embalse['AGUA_ACTUAL'].iloc[0]
-    at = df_embalse['AGUA_TOTAL'].iloc[0]
+# Unidades temporales en nanosegundos (año juliano y mes medio) para calcular
+# los umbrales de las ventanas con enteros en vez de relativedelta
+NS_DIA = 86_400_000_000_000
+NS_ANIO = int(365.25 * NS_DIA)
+NS_MES = int(30.44 * NS_DIA)
 
-    # --- CORRECCIÓN PARA VARIACIONES ---
-    # Excluimos la fecha actual para buscar únicamente en el histórico pasado
-    df_pasado = df_embalse[df_embalse['FECHA'] < fecha_referencia]
-    
-    # m1s: Dato inmediatamente anterior (la "semana pasada" real)
-    # Si por algún motivo es un embalse nuevo sin histórico, usamos 'aa' para no romper nada
-    m1s = df_pasado['AGUA_ACTUAL'].iloc[0] if not df_pasado.empty else aa
+# Anchos de las ventanas como constantes de módulo: numba los congela en el
+# momento de compilar, de modo que el bucle interno compara contra inmediatos
+_V_1S = 7 * NS_DIA
+_V_2S = 14 * NS_DIA
+_V_1M = 30 * NS_DIA
+_V_3A = 3 * NS_ANIO
+_V_5A = 5 * NS_ANIO
+_V_10A = 10 * NS_ANIO
+_V_20A = 20 * NS_ANIO
+_V_MA1_INI = NS_ANIO - NS_MES
+_V_MA1_FIN = NS_ANIO + NS_MES
 
-    # m2s: Dos semanas (buscamos un registro de hace al menos 13 días para evitar solapamientos)
-    df_2s = df_embalse[df_embalse['FECHA'] <= fecha_referencia - pd.Timedelta(days=13)]
-    m2s = df_2s['AGUA_ACTUAL'].iloc[0] if not df_2s.empty else m1s
 
-    # m1m: Un mes (buscamos un registro de hace al menos 27 días)
-    df_1m = df_embalse[df_embalse['FECHA'] <= fecha_referencia - pd.Timedelta(days=27)]
-    m1m = df_1m['AGUA_ACTUAL'].iloc[0] if not df_1m.empty else m2s
+@njit(parallel=True, fastmath=True, cache=True)
+def _stats_kernel(offsets, fechas, meses, agua, total, mes_ref, out):
+    """Kernel compilado: un embalse por hilo, acumulando sumas/cuentas por ventana.
 
-    # Filtros históricos del mismo mes
-    df_hist_mes = df_embalse[df_embalse['FECHA'].dt.month == mes_ref]
-    
-    def media_historica(anios):
-        fecha_limite = fecha_referencia - relativedelta(years=anios)
-        return df_hist_mes[df_hist_mes['FECHA'] >= fecha_limite]['AGUA_ACTUAL'].mean()
-
-    # Mismo mes año anterior
-    fecha_anio_ant_inicio = fecha_referencia - relativedelta(years=1, months=1)
-    fecha_anio_ant_fin = fecha_referencia - relativedelta(years=1) + relativedelta(months=1)
-    df_anio_ant = df_embalse[(df_embalse['FECHA'] > fecha_anio_ant_inicio) & 
-                             (df_embalse['FECHA'] <= fecha_anio_ant_fin) & 
-                             (df_embalse['FECHA'].dt.month == mes_ref)]
-
-    stats = {
-        'aa': round(aa, 2),
-        'at': round(at, 2),
-        'f': fecha_referencia.strftime('%Y-%m-%d'),
-        'm1s': round(m1s, 2),
-        'm2s': round(m2s, 2),
-        'm1m': round(m1m, 2),
-        'ma1': round(df_anio_ant['AGUA_ACTUAL'].mean(), 2) if not df_anio_ant.empty else None,
-        'h3a': round(media_historica(3), 2),
-        'h5a': round(media_historica(5), 2),
-        'h10a': round(media_historica(10), 2),
-        'h20a': round(media_historica(20), 2),
-        'ht': round(df_hist_mes['AGUA_ACTUAL'].mean(), 2)
-    }
-    return pd.Series(stats)
+    Las comparaciones de fechas son enteros (ns desde época): sin objetos Python
+    en el bucle caliente. Los arrays llegan ordenados por (grupo, fecha desc),
+    así que la primera fila de cada corte es el dato más reciente. Cada fila se
+    compara por su antigüedad (ref - fecha) contra los anchos de ventana _V_*,
+    que numba incrusta como literales al compilar.
+    """
+    for g in prange(len(offsets) - 1):
+        ini, fin = offsets[g], offsets[g + 1]
+        ref = fechas[ini]
+        mes = mes_ref[g]
+
+        # Dato más reciente: primera fila del grupo
+        out[g, 0] = agua[ini]
+        out[g, 1] = total[ini]
+
+        s1s = 0.0; c1s = 0
+        s2s = 0.0; c2s = 0
+        s1m = 0.0; c1m = 0
+        sma1 = 0.0; cma1 = 0
+        s3a = 0.0; c3a = 0
+        s5a = 0.0; c5a = 0
+        s10a = 0.0; c10a = 0
+        s20a = 0.0; c20a = 0
+        sht = 0.0; cht = 0
+
+        for i in range(ini, fin):
+            d = ref - fechas[i]
+            v = agua[i]
+            # Las ventanas cortas están anidadas (1s ⊂ 2s ⊂ 1m): comprobaciones
+            # en cascada, de modo que las filas antiguas salen con un solo if.
+            if d <= _V_1M:
+                s1m += v; c1m += 1
+                if d <= _V_2S:
+                    s2s += v; c2s += 1
+                    if d <= _V_1S:
+                        s1s += v; c1s += 1
+            if meses[i] == mes:
+                sht += v; cht += 1
+                # Ventanas históricas también anidadas (3a ⊂ 5a ⊂ 10a ⊂ 20a)
+                if d <= _V_20A:
+                    s20a += v; c20a += 1
+                    if d <= _V_10A:
+                        s10a += v; c10a += 1
+                        if d <= _V_5A:
+                            s5a += v; c5a += 1
+                            if d <= _V_3A:
+                                s3a += v; c3a += 1
+                if _V_MA1_INI <= d < _V_MA1_FIN:
+                    sma1 += v; cma1 += 1
+
+        out[g, 2] = s1s / c1s if c1s else np.nan
+        out[g, 3] = s2s / c2s if c2s else np.nan
+        out[g, 4] = s1m / c1m if c1m else np.nan
+        out[g, 5] = sma1 / cma1 if cma1 else np.nan
+        out[g, 6] = s3a / c3a if c3a else np.nan
+        out[g, 7] = s5a / c5a if c5a else np.nan
+        out[g, 8] = s10a / c10a if c10a else np.nan
+        out[g, 9] = s20a / c20a if c20a else np.nan
+        out[g, 10] = sht / cht if cht else np.nan
+
+
+def calcular_estadisticas(df):
+    """Calcula los indicadores estadísticos de todos los embalses de una vez.
+
+    Prepara arrays numpy contiguos por embalse (patrón de offsets por grupo) y
+    delega el cálculo de las medias por ventana en un kernel numba paralelo,
+    sin reentrar en Python por cada grupo.
+    """
+    claves = ['AMBITO_NOMBRE', 'EMBALSE_NOMBRE']
+
+    # Clave compuesta factorizada a un único código entero denso: nos
+    # ahorramos la maquinaria de groupby (ngroup desmonta y vuelve a montar
+    # el índice) y trabajamos sólo con arrays numpy a partir de aquí.
+    # factorize aprovecha los códigos si las columnas ya son categóricas.
+    codes_a, _ = pd.factorize(df['AMBITO_NOMBRE'])
+    codes_e, _ = pd.factorize(df['EMBALSE_NOMBRE'])
+    gid, _ = pd.factorize(codes_a.astype(np.int64) * (int(codes_e.max()) + 1) + codes_e)
+
+    # Una sola ordenación global por (grupo, fecha descendente): cada embalse
+    # queda como corte contiguo con su dato más reciente en la primera fila
+    fechas = df['FECHA'].to_numpy('datetime64[ns]').view('i8')
+    orden = np.lexsort((-fechas, gid))
+    gid = gid[orden]
+    fechas = fechas[orden]
+    meses = df['FECHA'].dt.month.to_numpy(np.int64)[orden]
+    # float32: la mitad de bytes por celda en el bucle caliente; el kernel
+    # acumula en float64, así que las medias no pierden precisión apreciable
+    agua = df['AGUA_ACTUAL'].to_numpy(np.float32)[orden]
+    total = df['AGUA_TOTAL'].to_numpy(np.float32)[orden]
+
+    # Fronteras de grupo sobre los códigos ya ordenados
+    limites = np.flatnonzero(np.diff(gid)) + 1
+    offsets = np.concatenate(([0], limites, [len(gid)])).astype(np.int64)
+    n_grupos = len(offsets) - 1
+
+    # Fecha de referencia (primera fila de cada grupo tras la ordenación);
+    # los umbrales de ventana van incrustados en el propio kernel.
+    refs = fechas[offsets[:-1]]
+    refs_ts = pd.DatetimeIndex(refs.view('datetime64[ns]'))
+    mes_ref = refs_ts.month.to_numpy(np.int64)
+
+    out = np.empty((n_grupos, len(_COLS_STATS)), dtype=np.float64)
+    _stats_kernel(offsets, fechas, meses, agua, total, mes_ref, out)
+
+    # Reconstrucción del resultado en una sola pasada: el DataFrame adopta la
+    # matriz preasignada sin copiarla, las claves se toman de la primera fila
+    # de cada grupo como categóricas y las fechas se formatean vectorizadas
+    cabezas = orden[offsets[:-1]]
+    agg = pd.DataFrame(out, columns=_COLS_STATS, copy=False)
+    agg.insert(0, 'AMBITO_NOMBRE', pd.Categorical(df['AMBITO_NOMBRE'].to_numpy()[cabezas]))
+    agg.insert(1, 'EMBALSE_NOMBRE', pd.Categorical(df['EMBALSE_NOMBRE'].to_numpy()[cabezas]))
+    agg['f'] = refs_ts.strftime('%Y-%m-%d')
+    # Redondeo de todos los indicadores en una única llamada vectorizada
+    agg = agg.round(dict.fromkeys(_COLS_STATS, 2))
+
+    orden_cols = claves + ['aa', 'at', 'f', 'm1s', 'm2s', 'm1m', 'ma1',
+                           'h3a', 'h5a', 'h10a', 'h20a', 'ht']
+    return agg[orden_cols]
+
+
+def calcular_estadisticas_con_cache(df):
+    """Calcula las estadísticas reutilizando la caché de la ejecución anterior.
+
+    MITECO añade filas nuevas pero el histórico es estable: la firma de cada
+    embalse (última FECHA, nº de filas) identifica si su serie cambió. Los
+    grupos con firma idéntica a la cacheada se devuelven tal cual y el kernel
+    sólo procesa los embalses con datos nuevos.
+    """
+    claves = ['AMBITO_NOMBRE', 'EMBALSE_NOMBRE']
+    firma = (df.groupby(claves, observed=True)
+               .agg(mx=('FECHA', 'max'), n=('FECHA', 'size'))
+               .reset_index())
+
+    if firma.empty:
+        # Sin embalses tras la limpieza: devolvemos el esquema vacío para
+        # que el pipeline genere un array "datos" vacío en vez de romperse
+        return pd.DataFrame(columns=claves + ['aa', 'at', 'f', 'm1s', 'm2s', 'm1m',
+                                              'ma1', 'h3a', 'h5a', 'h10a', 'h20a', 'ht'])
+
+    vigentes = None
+    if os.path.exists(CACHE_FILE):
+        try:
+            cache = pd.read_parquet(CACHE_FILE)
+            vigentes = firma.merge(cache, on=claves + ['mx', 'n'], how='inner')
+        except Exception as e:
+            # Caché ilegible o con esquema antiguo: recomputamos todo
+            console.print(f"[yellow]⚠ Caché de estadísticas descartada: {e}[/yellow]")
+            vigentes = None
+
+    if vigentes is not None and not vigentes.empty:
+        marcado = firma.merge(vigentes[claves], on=claves, how='left', indicator=True)
+        pendientes = marcado.loc[marcado['_merge'] == 'left_only', claves]
+    else:
+        pendientes = firma[claves]
+
+    if pendientes.empty and vigentes is not None:
+        resultado = vigentes.drop(columns=['mx', 'n'])
+    else:
+        nuevos = calcular_estadisticas(df.merge(pendientes, on=claves))
+        if vigentes is not None and not vigentes.empty:
+            resultado = pd.concat([vigentes.drop(columns=['mx', 'n']), nuevos],
+                                  ignore_index=True)
+        else:
+            resultado = nuevos
+    resultado = resultado.sort_values(claves, ignore_index=True)
+
+    # Persistimos resultado+firma para la próxima ejecución; la caché es una
+    # optimización, nunca debe tumbar el pipeline
+    try:
+        resultado.merge(firma, on=claves).to_parquet(CACHE_FILE, index=False)
+    except Exception as e:
+        console.print(f"[yellow]⚠ No se pudo escribir la caché de estadísticas: {e}[/yellow]")
+
+    return resultado
 def procesar_datos():
     with Progress(
         SpinnerColumn(), TextColumn("[progress.description]{task.description}"),
@@ -155,13 +310,57 @@ def procesar_datos():
         # 1. Extracción con mdb-export
         task1 = progress.add_task("[yellow]Extrayendo datos MDB...", total=None)
         try:
-            proceso = subprocess.Popen(['mdb-export', '-D', '%Y-%m-%d %H:%M:%S', MDB_FILE, TABLE_NAME], 
-                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            stdout, stderr = proceso.communicate()
-            if proceso.returncode != 0:
-                raise Exception(f"mdb-export falló: {stderr.decode('utf-8')}")
-            
-            df = pd.read_csv(io.BytesIO(stdout), dtype=str)
+            # Nota: se evaluó leer el MDB sin subproceso (pandas_access, meza),
+            # pero esas librerías envuelven el propio mdb-export con pd.read_csv
+            # de una sola hebra, que es estrictamente peor que esta tubería con
+            # el parser de Arrow. No hay binding mantenido de libmdb en PyPI.
+            proceso = subprocess.Popen(['mdb-export', '-D', '%Y-%m-%d %H:%M:%S', MDB_FILE, TABLE_NAME],
+                                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, bufsize=1 << 20)
+            # stderr se drena en un hilo aparte mientras parseamos stdout:
+            # si mdb-export escribiera más que el buffer de la tubería,
+            # leerlo sólo al final provocaría un interbloqueo
+            stderr_buf = []
+            hilo_stderr = threading.Thread(
+                target=lambda: stderr_buf.append(proceso.stderr.read()))
+            hilo_stderr.start()
+
+            def _error_mdb_export():
+                hilo_stderr.join()
+                proceso.wait()
+                return b''.join(stderr_buf).decode('utf-8', 'replace').strip()
+
+            # Parseamos el CSV en streaming directamente desde la tubería:
+            # sin buffer intermedio del CSV completo y con el parser
+            # multihilo de Arrow. Los decimales con coma se convierten aquí.
+            try:
+                tabla = pacsv.read_csv(
+                    proceso.stdout,
+                    convert_options=pacsv.ConvertOptions(
+                        # float32 basta de sobra para hm³ con 2 decimales y
+                        # reduce a la mitad el ancho de banda del kernel de stats
+                        column_types={'AGUA_TOTAL': pa.float32(),
+                                      'AGUA_ACTUAL': pa.float32(),
+                                      'FECHA': pa.timestamp('ns')},
+                        # El formato lo fija el -D de mdb-export: parseo C con
+                        # patrón explícito, sin inferencia fila a fila
+                        timestamp_parsers=['%Y-%m-%d %H:%M:%S'],
+                        decimal_point=',',
+                        null_values=[''],
+                        strings_can_be_null=True,
+                    ),
+                )
+            except pa.ArrowInvalid as arrow_err:
+                # Con stdout vacío (p. ej. TABLE_NAME obsoleto: MITECO cambia
+                # el rango de años del nombre de la tabla) Arrow falla antes
+                # de que veamos el diagnóstico real: lo recuperamos de stderr
+                stderr = _error_mdb_export()
+                raise Exception(f"mdb-export falló: {stderr or arrow_err}")
+
+            hilo_stderr.join()
+            if proceso.wait() != 0:
+                raise Exception(f"mdb-export falló: {_error_mdb_export()}")
+
+            df = tabla.to_pandas()
             progress.update(task1, completed=100)
         except Exception as e:
             console.print(f"[bold red]✖ Error leyendo MDB: {e}[/bold red]")
@@ -171,18 +370,26 @@ def procesar_datos():
         task2 = progress.add_task("[yellow]Limpiando y tipando datos...", total=None)
         df.columns = [c.split('"')[0].strip().replace(' ', '_') for c in df.columns]
         for col in ['AGUA_TOTAL', 'AGUA_ACTUAL']:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col].str.replace(',', '.', regex=False), errors='coerce')
-        
-        df['FECHA'] = pd.to_datetime(df['FECHA'], errors='coerce')
+            # Arrow ya entrega estas columnas como float32; la conversión sólo
+            # se aplica si llegaron como texto (p. ej. cabeceras inesperadas)
+            if col in df.columns and df[col].dtype == object:
+                df[col] = pd.to_numeric(df[col].str.replace(',', '.', regex=False),
+                                        errors='coerce').astype(np.float32)
+
+        # FECHA ya llega como datetime64[ns] desde el parser de Arrow
         df = df.dropna(subset=['AGUA_TOTAL', 'AGUA_ACTUAL', 'AMBITO_NOMBRE', 'EMBALSE_NOMBRE', 'FECHA'])
+        # Claves de agrupación como categóricas: el groupby compara códigos
+        # enteros en vez de hashear cada cadena repetida miles de veces
+        df['AMBITO_NOMBRE'] = df['AMBITO_NOMBRE'].astype('category')
+        df['EMBALSE_NOMBRE'] = df['EMBALSE_NOMBRE'].astype('category')
         progress.update(task2, completed=100)
 
         # 3. Cálculos Estadísticos
         task3 = progress.add_task("[yellow]Calculando estadísticas (puede tardar unos segundos)...", total=None)
-        # Agrupamos y aplicamos la función estadística a cada embalse
-        df_agrupado = df.groupby(['AMBITO_NOMBRE', 'EMBALSE_NOMBRE']).apply(calcular_estadisticas_embalse).reset_index()
-        
+        # Estadísticas de todos los embalses; los que no cambiaron desde la
+        # última ejecución salen de la caché sin pasar por el kernel
+        df_agrupado = calcular_estadisticas_con_cache(df)
+
         # Renombrar columnas de agrupación a formato corto
         df_agrupado.rename(columns={'AMBITO_NOMBRE': 'an', 'EMBALSE_NOMBRE': 'en'}, inplace=True)
         progress.update(task3, completed=100)
@@ -190,57 +397,47 @@ def procesar_datos():
 # 4. Exportación JSON compacta e híbrida (Legible por humanos)
         task4 = progress.add_task("[yellow]Generando JSON optimizado y legible...", total=None)
         
-        # Manejo de NaNs (reemplazando por None para que JSON lo serialice como null)
-        df_agrupado = df_agrupado.where(pd.notnull(df_agrupado), None)
-        
-        export_data = {
-            "metadatos": METADATA,
-            "datos": df_agrupado.to_dict(orient='records')
-        }
-        
+        # Los NaN no necesitan conversión previa: to_json ya los emite como
+        # null, así que evitamos la copia a object de todo el DataFrame
+
         # --- ESCRITURA HÍBRIDA ---
-        with open(JSON_OUTPUT, 'w', encoding='utf-8') as f:
-            # 1. Escribimos los metadatos con indentación normal
-            f.write('{\n  "metadatos": ')
-            json.dump(export_data["metadatos"], f, ensure_ascii=False, indent=2)
-            
-            # 2. Abrimos la lista de datos
-            f.write(',\n  "datos": [\n')
-            
-            # 3. Escribimos cada registro en una única línea
-            records = export_data["datos"]
-            for i, record in enumerate(records):
-                # separators=(',', ':') elimina espacios innecesarios dentro de la misma línea
-                json_str = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
-                f.write(f'    {json_str}')
-                
-                # Añadimos coma y salto de línea salvo en el último registro
-                if i < len(records) - 1:
-                    f.write(',\n')
-                else:
-                    f.write('\n')
-                    
-            # 4. Cerramos el JSON
-            f.write('  ]\n}\n')
+        # Todos los registros en una sola llamada C de pandas
+        # (orient='records', lines=True: una línea por registro), sin iterar
+        # dict a dict en Python; sólo reinsertamos comas e indentado
+        lineas = df_agrupado.to_json(orient='records', lines=True, force_ascii=False)
+        cuerpo = lineas.rstrip('\n').replace('\n', ',\n    ')
+
+        # Cada sección ya serializada se emite con os.writev: una única
+        # llamada al sistema tipo gather, sin concatenar los buffers ni
+        # pasarlos por el buffer intermedio de un archivo bufferizado
+        segmentos = [
+            b'{\n  "metadatos": ',
+            orjson.dumps(METADATA, option=orjson.OPT_INDENT_2),
+            b',\n  "datos": [\n    ',
+            cuerpo.encode('utf-8'),
+            b'\n  ]\n}\n',
+        ]
+        with open(JSON_OUTPUT, 'wb', buffering=0) as f:
+            while segmentos:
+                n = os.writev(f.fileno(), segmentos)
+                # writev puede quedarse corto: descartamos lo ya escrito
+                while segmentos and n >= len(segmentos[0]):
+                    n -= len(segmentos.pop(0))
+                if n:
+                    segmentos[0] = segmentos[0][n:]
         
         progress.update(task4, completed=100)
 
 def main():
     console.rule("[bold blue]Iniciando ETL Hidrológico MITECO")
     
-    descargar_y_extraer()
-    
-    # Control de Estado (Hash)
-    current_hash = get_file_hash(MDB_FILE)
-    if os.path.exists(HASH_FILE):
-        with open(HASH_FILE, 'r') as f:
-            last_hash = f.read().strip()
-            
-        if current_hash == last_hash:
-            console.print("[green]✔ El archivo MDB no ha cambiado (Hash idéntico). Proceso finalizado para ahorrar recursos.[/green]")
-            os.remove(MDB_FILE) # Limpiamos el MDB
-            sys.exit(0)
-    
+    # Control de Estado: el hash del ZIP se calcula durante la descarga y,
+    # si no hay cambios, ni siquiera se llega a extraer el MDB
+    current_hash = descargar_y_extraer()
+    if current_hash is None:
+        console.print("[green]✔ El ZIP no ha cambiado (Hash idéntico). Proceso finalizado para ahorrar recursos.[/green]")
+        sys.exit(0)
+
     console.print("[yellow]Nuevos datos detectados. Iniciando procesamiento...[/yellow]")
     procesar_datos()
     